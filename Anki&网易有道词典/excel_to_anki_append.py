@@ -7,26 +7,70 @@
   - 导入前：先对 Excel 内部去重（大小写无关）
   - 过滤：排除牌组里已存在的 Front（从 Anki 拉现有 Front）
   - 预检总览 + 交互确认
-  - 分批导入 + 逐条日志
-依赖：pip install pandas openpyxl requests
+  - 分批导入（按每批耗时自适应调整批大小）+ 逐条日志
+依赖：pip install openpyxl requests（可选 msgspec / orjson：更快的 JSON 编码）
 确保：Anki 运行且已安装 AnkiConnect（http://localhost:8765）
 """
 
+import re
+import sys
+import json
+import time
+from functools import lru_cache
+from itertools import islice
+from typing import List, Dict, Any, Set, Tuple, FrozenSet
+
 import requests
-import pandas as pd
-from typing import List, Dict, Any, Set
+from requests.adapters import HTTPAdapter
+import openpyxl
+
+try:
+    import orjson
+except ImportError:  # 没装 orjson 时退回标准库 json
+    orjson = None
+try:
+    import msgspec
+except ImportError:  # 没装 msgspec 时 note 用普通 dict
+    msgspec = None
 
 ANKI_URL = "http://localhost:8765"
 MODEL_NAME = "Youdao Basic (Auto)"
 TAGS = ["youdao", "auto"]
-BATCH_SIZE = 50  # 稳一点
+BATCH_SIZE = 64  # 初始批大小，导入时按每批耗时自适应调整
+BATCH_SIZE_MIN = 16
+BATCH_SIZE_MAX = 512
+BATCH_SLOW_SECS = 2.0  # 单次请求超过这个耗时就不再加大批次
+MULTI_BATCHES = 4  # 每次 multi 请求合并的 addNotes 批次数
+NOTES_INFO_BATCH = 2000  # notesInfo 每次最多查询的 note 数，避免一次拉取整个牌组
+TIMEOUT = 30
+PRECHECK = False  # 已从牌组拉到现有 Front 时，是否仍用 canAddNotes 预检
+
+# 复用同一个连接（keep-alive），避免每次 RPC 都重新建立 TCP 连接
+SESSION = requests.Session()
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
 
 
 # ---------- 基础 RPC ----------
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+def _dumps(obj: Any) -> bytes:
+    if msgspec is not None:
+        return msgspec.json.encode(obj)
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+def _loads(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
 def _post(payload: Dict[str, Any]) -> Dict[str, Any]:
-    r = requests.post(ANKI_URL, json=payload)
+    r = SESSION.post(ANKI_URL, data=_dumps(payload), headers=JSON_HEADERS, timeout=TIMEOUT)
     r.raise_for_status()
-    return r.json()
+    return _loads(r.content)
 
 def invoke(action: str, **params):
     payload = {"action": action, "version": 6, "params": params}
@@ -35,10 +79,30 @@ def invoke(action: str, **params):
         return {"error": resp["error"], "result": resp.get("result")}
     return resp.get("result")
 
+def invoke_multi(calls: List[Tuple[str, Dict[str, Any]]]) -> List[Any]:
+    """用 multi 把多个 action 合并成一次请求；返回值与逐个 invoke 的结果一一对应"""
+    if not calls:
+        return []
+    actions = [{"action": a, "version": 6, "params": p} for a, p in calls]
+    res = invoke("multi", actions=actions)
+    if isinstance(res, dict) and res.get("error"):
+        # multi 本身失败：每个子 action 都视为同样的错误
+        return [res] * len(calls)
+    results = []
+    for r in res:
+        if isinstance(r, dict) and r.get("error"):
+            results.append({"error": r["error"], "result": r.get("result")})
+        elif isinstance(r, dict) and "result" in r:
+            results.append(r["result"])
+        else:
+            results.append(r)
+    return results
+
 
 # ---------- 环境 ----------
-def ensure_deck(deck_name: str):
-    decks = invoke("deckNames")
+def ensure_deck(deck_name: str, decks=None):
+    if decks is None:
+        decks = invoke("deckNames")
     if isinstance(decks, dict):
         raise RuntimeError(f"AnkiConnect error (deckNames): {decks}")
     if deck_name not in decks:
@@ -46,8 +110,9 @@ def ensure_deck(deck_name: str):
         if isinstance(res, dict) and res.get("error"):
             raise RuntimeError(f"AnkiConnect error (createDeck): {res}")
 
-def ensure_model(model_name: str):
-    models = invoke("modelNames")
+def ensure_model(model_name: str, models=None):
+    if models is None:
+        models = invoke("modelNames")
     if isinstance(models, dict):
         raise RuntimeError(f"AnkiConnect error (modelNames): {models}")
     if model_name in models:
@@ -72,38 +137,78 @@ hr { margin: 12px 0; }
         raise RuntimeError(f"AnkiConnect error (createModel): {res}")
 
 
+# ---------- Note ----------
+if msgspec is not None:
+    class Note(msgspec.Struct):
+        """addNotes 的 note 结构固定，用 Struct 比 dict 更省内存、编码更快"""
+        deckName: str
+        modelName: str
+        fields: Dict[str, str]
+        tags: List[str]
+        options: Dict[str, Any]
+
+def make_note(deck_name: str, front: str, back: str, options: Dict[str, Any]) -> Any:
+    """装了 msgspec 时返回 Note，否则返回等价的 dict"""
+    fields = {"Front": front, "Back": back}
+    if msgspec is not None:
+        return Note(deckName=deck_name, modelName=MODEL_NAME, fields=fields, tags=TAGS, options=options)
+    return {
+        "deckName": deck_name,
+        "modelName": MODEL_NAME,
+        "fields": fields,
+        "tags": TAGS,
+        "options": options
+    }
+
+
 # ---------- 工具 ----------
+_NL_RE = re.compile(r"\r\n?|\n")
+
+@lru_cache(maxsize=4096)
 def newline_to_html(s: str) -> str:
     if s is None:
         return ""
-    return str(s).replace("\r\n", "\n").replace("\r", "\n").replace("\n", "<br>")
+    return _NL_RE.sub("<br>", str(s))
+
+def cell_text(row: Tuple[Any, ...], idx: int) -> str:
+    """取一行中第 idx 列的文本（空单元格返回空串）"""
+    v = row[idx] if idx < len(row) else None
+    return "" if v is None else str(v).strip()
 
 def chunked(seq, size):
     for i in range(0, len(seq), size):
         yield seq[i:i + size]
 
-def get_existing_fronts(deck_name: str) -> Set[str]:
-    """获取目标牌组里现有 Front 字段（小写）"""
+def deck_query(deck_name: str) -> str:
     # 注意 deck 名含空格/中文时建议加引号
-    query = f'deck:"{deck_name}"'
-    note_ids = invoke("findNotes", query=query)
+    return f'deck:"{deck_name}"'
+
+def iter_front_values(note_ids: List[int]):
+    """按 NOTES_INFO_BATCH 分批 notesInfo，逐个产出 Front 字段原文"""
+    for batch in chunked(note_ids, NOTES_INFO_BATCH):
+        info = invoke("notesInfo", notes=batch)
+        if isinstance(info, dict) and info.get("error"):
+            raise RuntimeError(f"AnkiConnect error (notesInfo): {info}")
+        for it in info:
+            fields = it.get("fields", {})
+            if "Front" in fields:
+                yield fields["Front"]["value"]
+            elif "front" in fields:
+                yield fields["front"]["value"]
+            else:
+                yield ""
+        del info  # 只保留 Front，本批完整响应尽早释放
+
+def get_existing_fronts(deck_name: str, note_ids=None) -> FrozenSet[str]:
+    """获取目标牌组里现有 Front 字段（casefold 后）；可传入已查到的 note_ids"""
+    if note_ids is None:
+        note_ids = invoke("findNotes", query=deck_query(deck_name))
     if isinstance(note_ids, dict) and note_ids.get("error"):
         raise RuntimeError(f"AnkiConnect error (findNotes): {note_ids}")
     if not note_ids:
-        return set()
-    info = invoke("notesInfo", notes=note_ids)
-    if isinstance(info, dict) and info.get("error"):
-        raise RuntimeError(f"AnkiConnect error (notesInfo): {info}")
-    fronts = set()
-    for it in info:
-        fields = it.get("fields", {})
-        front = ""
-        if "Front" in fields:
-            front = fields["Front"]["value"]
-        elif "front" in fields:
-            front = fields["front"]["value"]
-        fronts.add(front.strip().lower())
-    return fronts
+        return frozenset()
+    # 一次构建、之后只读：直接生成 frozenset，key 与 Excel 侧一样用 strip().casefold()
+    return frozenset(front.strip().casefold() for front in iter_front_values(note_ids))
 
 
 # ---------- 主流程 ----------
@@ -111,56 +216,79 @@ def main():
     xlsx_path = input("请输入 youdao_defs.xlsx 文件路径: ").strip().strip('"').strip("'")
     deck_name = input("请输入要追加导入的 Anki 牌组名称: ").strip()
 
-    # 读 Excel（兼容大小写/不规范列名）
-    df = pd.read_excel(xlsx_path, dtype=str).fillna("")
-    lower_cols = {c.lower(): c for c in df.columns}
-    if "word" not in lower_cols or "definition" not in lower_cols:
-        raise RuntimeError("Excel 需要包含列名：word, definition")
-    df = df.rename(columns={lower_cols["word"]: "word", lower_cols["definition"]: "definition"})
-
-    # 1) 先去除 Excel 内部重复（大小写无关，保留首次出现）
-    before = len(df)
-    df["_key"] = df["word"].astype(str).str.strip().str.lower()
-    df = df[~df["_key"].duplicated(keep="first")].copy()
-    removed_in_file = before - len(df)
-    df.drop(columns=["_key"], inplace=True)
-
-    ensure_deck(deck_name)
-    ensure_model(MODEL_NAME)
-
-    # 2) 过滤掉牌组里已存在的 Front
-    existing = get_existing_fronts(deck_name)
-    df["_key"] = df["word"].astype(str).str.strip().str.lower()
-    df = df[~df["_key"].isin(existing)].copy()
-    removed_in_deck = before - removed_in_file - len(df)
-    df.drop(columns=["_key"], inplace=True)
-
-    # 构造 notes
-    words: List[str] = []
-    notes: List[Dict[str, Any]] = []
-    for _, row in df.iterrows():
-        word = (row.get("word") or "").strip()
-        definition = (row.get("definition") or "").strip()
-        if not word:
+    # 读 Excel（read_only 流式读取；兼容大小写/不规范列名）
+    wb = openpyxl.load_workbook(xlsx_path, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        header = next(ws.iter_rows(max_row=1, values_only=True), ())
+        lower_cols = {str(c).lower(): i for i, c in enumerate(header) if c is not None}
+        if "word" not in lower_cols or "definition" not in lower_cols:
+            raise RuntimeError("Excel 需要包含列名：word, definition")
+        word_idx, def_idx = lower_cols["word"], lower_cols["definition"]
+
+        # 并列数组：显示用原词 / 查重用 key（只在这里 casefold 一次）/ 释义
+        words_display: List[str] = []
+        words_key: List[str] = []
+        defs_raw: List[str] = []
+        for row in ws.iter_rows(min_row=2, values_only=True):
+            if all(v is None for v in row):
+                continue
+            word = cell_text(row, word_idx)
+            words_display.append(word)
+            words_key.append(word.casefold())
+            defs_raw.append(cell_text(row, def_idx))
+    finally:
+        wb.close()
+    before = len(words_display)
+
+    # 一次 multi 请求拿到牌组列表、模板列表和牌组内的 note id
+    decks, models, note_ids = invoke_multi([
+        ("deckNames", {}),
+        ("modelNames", {}),
+        ("findNotes", {"query": deck_query(deck_name)}),
+    ])
+    ensure_deck(deck_name, decks)
+    ensure_model(MODEL_NAME, models)
+
+    # 一次遍历完成去重（大小写无关，保留首次出现）：
+    #   1) Excel 内部重复  2) 牌组里已存在的 Front
+    try:
+        existing = get_existing_fronts(deck_name, note_ids)
+        fronts_ok = True
+    except RuntimeError as e:
+        print(f"[警告] 获取牌组现有 Front 失败，改用 canAddNotes 预检：{e}")
+        existing = frozenset()
+        fronts_ok = False
+    seen: Set[str] = set()
+    rows: List[Tuple[str, str]] = []
+    removed_in_file = removed_in_deck = 0
+    for key, word, definition in zip(words_key, words_display, defs_raw):
+        if key in seen:
+            removed_in_file += 1
+            continue
+        seen.add(key)
+        if key in existing:
+            removed_in_deck += 1
             continue
-        back_html = newline_to_html(definition)
-        note = {
+        rows.append((word, definition))
+
+    # 构造 notes（options 对所有 note 都一样，只建一份共享引用）
+    note_options = {
+        "allowDuplicate": False,
+        "duplicateScope": "deck",
+        "duplicateScopeOptions": {
             "deckName": deck_name,
-            "modelName": MODEL_NAME,
-            "fields": {"Front": word, "Back": back_html},
-            "tags": TAGS,
-            "options": {
-                "allowDuplicate": False,
-                "duplicateScope": "deck",
-                "duplicateScopeOptions": {
-                    "deckName": deck_name,
-                    "checkChildren": False,
-                    "checkAllModels": False
-                }
-            }
+            "checkChildren": False,
+            "checkAllModels": False
         }
+    }
+    words: List[str] = []
+    notes: List[Any] = []
+    for word, definition in rows:
+        if not word:
+            continue
         words.append(word)
-        notes.append(note)
+        notes.append(make_note(deck_name, word, newline_to_html(definition), note_options))
 
     if not notes:
         print("没有可导入的记录。")
@@ -169,77 +297,195 @@ def main():
 
     # 3) 预检总览
     total = len(notes)
-    can = invoke("canAddNotes", notes=notes)
-    if isinstance(can, dict) and can.get("error"):
-        print(f"[警告] canAddNotes 异常，将直接导入并逐条判断：{can['error']}")
+    if fronts_ok and not PRECHECK:
+        # 本地去重已覆盖牌组内查重，无需再把全部 notes 发给 canAddNotes
         addable_mask = [True] * total
         predicted_skips = 0
     else:
-        addable_mask = list(can)
-        predicted_skips = addable_mask.count(False)
+        can = invoke("canAddNotes", notes=notes)
+        if isinstance(can, dict) and can.get("error"):
+            print(f"[警告] canAddNotes 异常，将直接导入并逐条判断：{can['error']}")
+            addable_mask = [True] * total
+            predicted_skips = 0
+        else:
+            addable_mask = list(can)
+            predicted_skips = addable_mask.count(False)
 
     print("\n====== 导入前总览 ======")
     print(f"Excel 原始：{before}")
     print(f"Excel 内部去重移除：{removed_in_file}")
     print(f"牌组已存在移除：{removed_in_deck}")
     print(f"待提交总数：{total}")
-    print(f"预测可新增：{addable_mask.count(True)}")
+    predicted_adds = total - predicted_skips
+    print(f"预测可新增：{predicted_adds}")
     print(f"预测重复/不可添加：{predicted_skips}")
-    preview_dups = [w for w, ok in zip(words, addable_mask) if not ok][:20]
+    preview_dups = list(islice((w for w, ok in zip(words, addable_mask) if not ok), 20))
     if preview_dups:
         print("预计重复（前 20 个）：")
         for w in preview_dups:
             print(f"  - {w}")
     print("========================")
 
-    go = input(f"\n是否继续导入可新增的 {addable_mask.count(True)} 条？[y/N]: ").strip().lower()
+    go = input(f"\n是否继续导入可新增的 {predicted_adds} 条？[y/N]: ").strip().lower()
     if go not in ("y", "yes"):
         print("已取消导入。")
         return
 
-    # 4) 导入（分批 + 逐条日志）
-    def add_batch(batch_words, batch_notes):
-        nonlocal added_total, skipped_total, failed_total
-        add_res = invoke("addNotes", notes=batch_notes)
+    # 4) 导入（分批 + multi 合并请求 + 逐条日志；日志攒一批再统一输出）
+    log_buf: List[str] = []
+
+    def flush_log():
+        if log_buf:
+            sys.stdout.write("\n".join(log_buf) + "\n")
+            sys.stdout.flush()
+            log_buf.clear()
+
+    def record_duplicate(w):
+        nonlocal skipped_total, uncertain_total
+        if w in uncertain:
+            # 超时后无法确认就重发了：报重复多半是上次请求已写入，不算作跳过
+            log_buf.append(f"[无法确认] {w}（超时后重发报重复，可能已由上次请求写入）")
+            uncertain_total += 1
+        else:
+            log_buf.append(f"[重复跳过] {w}")
+            skipped_total += 1
+
+    def record_batch(batch_words, add_res):
+        nonlocal added_total, failed_total
         if isinstance(add_res, dict) and add_res.get("error"):
             errs = add_res["error"]
             if isinstance(errs, list):
                 for w, msg in zip(batch_words, errs):
                     if "duplicate" in str(msg).lower():
-                        print(f"[重复跳过] {w}")
-                        skipped_total += 1
+                        record_duplicate(w)
                     else:
-                        print(f"[失败] {w} -> {msg}")
+                        log_buf.append(f"[失败] {w} -> {msg}")
                         failed_total += 1
             else:
-                print(f"[失败] 整批失败 -> {errs}")
+                log_buf.append(f"[失败] 整批失败 -> {errs}")
                 failed_total += len(batch_words)
         else:
             for w, rid in zip(batch_words, add_res):
                 if isinstance(rid, int):
-                    print(f"[导入成功] {w} -> noteId={rid}")
+                    log_buf.append(f"[导入成功] {w} -> noteId={rid}")
                     added_total += 1
                 elif rid is None:
-                    print(f"[重复跳过] {w}")
-                    skipped_total += 1
+                    record_duplicate(w)
                 else:
-                    print(f"[失败] {w} -> {rid}")
+                    log_buf.append(f"[失败] {w} -> {rid}")
                     failed_total += 1
 
-    added_total = skipped_total = failed_total = 0
-
-    pairs_add = [(w, n) for (w, n), ok in zip(zip(words, notes), addable_mask) if ok]
-    pairs_skip = [(w, n) for (w, n), ok in zip(zip(words, notes), addable_mask) if not ok]
-
-    for w, _ in pairs_skip:
-        print(f"[重复跳过] {w}")
-
-    for batch in chunked(pairs_add, BATCH_SIZE):
-        batch_words = [w for w, _ in batch]
-        batch_notes = [n for _, n in batch]
-        add_batch(batch_words, batch_notes)
-
-    print(f"\n完成：新增 {added_total} 条，跳过/重复 {skipped_total} 条，失败 {failed_total} 条，总计 {total} 条。")
+    def can_add(span):
+        """对这一段调用 canAddNotes；请求失败或返回错误时返回 None"""
+        try:
+            can = invoke("canAddNotes", notes=[n for _, n in span])
+        except requests.RequestException:
+            return None
+        if isinstance(can, dict) and can.get("error"):
+            return None
+        return list(can)
+
+    added_total = skipped_total = failed_total = uncertain_total = 0
+    uncertain: Set[str] = set()
+
+    # 一次遍历：可新增的进 pairs_add，预检判定重复的直接记日志
+    pairs_add = []
+    for w, n, ok in zip(words, notes, addable_mask):
+        if ok:
+            pairs_add.append((w, n))
+        else:
+            log_buf.append(f"[重复跳过] {w}")
+            skipped_total += 1
+    flush_log()
+
+    # 自适应批大小：成功且不慢就翻倍，出错就减半；出过错后不再长回失败过的大小
+    # 每段发送前先做一次 canAddNotes 快照：请求出错后只有“发送前可加、现在重复”的才算已写入
+    batch_size = BATCH_SIZE
+    size_cap = BATCH_SIZE_MAX
+    span_elapsed = 0.0  # 当前这一段的累计耗时（包括失败的请求）
+    pos = 0
+    checked_end = 0  # pairs_add[pos:checked_end] 已做过发送前快照
+    snapshot_ok = False
+    while pos < len(pairs_add):
+        cap = batch_size * MULTI_BATCHES
+        if pos >= checked_end:
+            span = pairs_add[pos:pos + cap]
+            before_send = can_add(span)
+            snapshot_ok = before_send is not None
+            if snapshot_ok:
+                kept = []
+                for (w, n), ok in zip(span, before_send):
+                    if ok:
+                        kept.append((w, n))
+                    else:
+                        log_buf.append(f"[重复跳过] {w}")
+                        skipped_total += 1
+                pairs_add[pos:pos + len(span)] = kept
+                span = kept
+            checked_end = pos + len(span)
+            if not span:
+                flush_log()
+                continue
+        else:
+            span = pairs_add[pos:min(pos + cap, checked_end)]
+        group = list(chunked(span, batch_size))
+        start = time.monotonic()
+        try:
+            results = invoke_multi([("addNotes", {"notes": [n for _, n in batch]}) for batch in group])
+        except requests.RequestException as e:
+            span_elapsed += time.monotonic() - start
+            size_cap = max(BATCH_SIZE_MIN, batch_size // 2)
+            # addNotes 不是幂等的：出错的请求可能已部分写入，先确认再只处理剩下的
+            after = can_add(span)
+            if after is None:
+                uncertain.update(w for w, _ in span)
+                remaining = span
+            else:
+                remaining = []
+                for (w, n), ok in zip(span, after):
+                    if ok:
+                        remaining.append((w, n))
+                    elif snapshot_ok:
+                        log_buf.append(f"[导入成功] {w} -> (请求失败后确认已写入)")
+                        added_total += 1
+                    else:
+                        # 没有发送前快照，无法区分是本次写入还是原本就在牌组里
+                        log_buf.append(f"[无法确认] {w}（请求失败后报重复，可能已由本次请求写入）")
+                        uncertain_total += 1
+                pairs_add[pos:pos + len(span)] = remaining
+                checked_end -= len(span) - len(remaining)
+            if batch_size > BATCH_SIZE_MIN:
+                batch_size = size_cap
+                log_buf.append(f"[重试] 请求失败，批大小降为 {batch_size}，重发 {len(remaining)} 条 -> {e}")
+                flush_log()
+                continue
+            # 已是最小批次：剩下的记为失败，继续下一段
+            if remaining:
+                record_batch([w for w, _ in remaining], {"error": str(e), "result": None})
+            flush_log()
+            pos += len(remaining)
+            span_elapsed = 0.0
+            continue
+        span_elapsed += time.monotonic() - start
+
+        batch_failed = False
+        for batch, add_res in zip(group, results):
+            record_batch([w for w, _ in batch], add_res)
+            if isinstance(add_res, dict) and not isinstance(add_res.get("error"), list):
+                batch_failed = True
+        flush_log()
+        pos += len(span)
+
+        if batch_failed:
+            size_cap = max(BATCH_SIZE_MIN, batch_size // 2)
+            batch_size = size_cap
+        elif span_elapsed <= BATCH_SLOW_SECS:
+            batch_size = min(size_cap, batch_size * 2)
+        span_elapsed = 0.0
+
+    uncertain_note = f"无法确认 {uncertain_total} 条，" if uncertain_total else ""
+    print(f"\n完成：新增 {added_total} 条，跳过/重复 {skipped_total} 条，失败 {failed_total} 条，"
+          f"{uncertain_note}总计 {total} 条。")
 
 
 if __name__ == "__main__":
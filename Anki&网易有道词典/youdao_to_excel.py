@@ -8,26 +8,52 @@
   - 批次内查重（大小写无关）并跳过重复单词
   - 输出 youdao_defs.xlsx 到 words.txt 的同一路径
   - 多条释义用换行 \n 连接（Excel 单元格多行；Anki 导入勾选“Keep line breaks”即可换行显示）
-依赖：pip install requests beautifulsoup4 lxml pandas openpyxl
+  - 抓到的释义缓存到本地 sqlite（~/.cache/youdao_defs.sqlite，CACHE_TTL_DAYS 天后过期），
+    重复运行时只抓新单词；--refresh 忽略缓存全部重抓
+  - 可选 --format parquet 输出 youdao_defs.parquet（需 pip install pyarrow）
+依赖：pip install aiohttp lxml openpyxl
 """
 
 import time
 import random
+import asyncio
+import argparse
 import pathlib
 import logging
-from typing import List, Tuple
+import sqlite3
+from typing import List, Optional, Tuple
 
-import requests
-from bs4 import BeautifulSoup
-import pandas as pd
+import aiohttp
+from lxml import etree
+from lxml import html as LH
+from openpyxl import Workbook
 
 USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"
 BASE_URL = "https://dict.youdao.com/w/eng/{word}/"
 
-SLEEP_RANGE = (0.8, 1.6)  # 请求间隔
+HEADERS = {"User-Agent": USER_AGENT, "Accept-Language": "en-US,en;q=0.9"}
+
+# 限速与原先串行抓取（每次间隔 0.8~1.6 秒）相当，约每秒 0.8 个请求；
+# 并发只用来让等待响应与下一次请求的间隔重叠，在途请求数 ≈ 速率 × 单次响应耗时，留些余量即可
+REQUESTS_PER_SEC = 0.8  # 全局限速：所有协程合计每秒最多发起的请求数
+CONCURRENCY = 4  # 同时在途的请求数上限；调高 REQUESTS_PER_SEC 时按比例调高
+JITTER = 0.3  # 每次请求额外的随机等待（秒）
 TIMEOUT = 12
 RETRY = 2
 
+# 等价于 CSS 的 div.trans-container 等 class 选择器
+_TRANS_LI = "//div[contains(concat(' ', normalize-space(@class), ' '), ' trans-container ')]//ul//li"
+XPATH_PHRS = '(//*[@id="phrsListTab"])[1]' + _TRANS_LI
+XPATH_TRANS = _TRANS_LI
+XPATH_COLLINS = ('//div[@id="collinsResult"]'
+                 "//div[contains(concat(' ', normalize-space(@class), ' '), ' collinsMajorTrans ')]//p")
+
+_HTML_PARSER = LH.HTMLParser(encoding="utf-8")
+
+CACHE_PATH = pathlib.Path.home() / ".cache" / "youdao_defs.sqlite"
+CACHE_COMMIT_EVERY = 100  # 每写入多少条提交一次事务
+CACHE_TTL_DAYS = 30  # 缓存条目超过这个天数视为过期，重新抓取
+
 logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
 
 
@@ -36,34 +62,50 @@ def clean_invisibles(s: str) -> str:
     return s.replace("\u202a", "").replace("\u202b", "").replace("\ufeff", "")
 
 
-def load_words(path: pathlib.Path) -> List[str]:
+def load_words(path: pathlib.Path) -> Tuple[List[str], List[str]]:
+    """返回并列的 (原词列表, casefold 后的 key 列表)，key 只在这里计算一次"""
     if not path.exists():
         raise FileNotFoundError(f"未找到 {path}，请检查路径是否正确")
     words: List[str] = []
+    keys: List[str] = []
     seen_ci = set()  # case-insensitive 去重
     for line in path.read_text(encoding="utf-8").splitlines():
         w = clean_invisibles(line).strip()
         if not w or w.startswith("#"):
             continue
-        key = w.lower()
+        key = w.casefold()
         if key in seen_ci:
             continue  # 批次内重复 => 跳过
         seen_ci.add(key)
         words.append(w)
-    return words
+        keys.append(key)
+    return words, keys
+
 
+_next_slot = 0.0
 
-def fetch_html(url: str) -> str:
-    headers = {"User-Agent": USER_AGENT, "Accept-Language": "en-US,en;q=0.9"}
+
+async def wait_rate_slot():
+    """全局节流：相邻两次请求的发起间隔不小于 1 / REQUESTS_PER_SEC 秒（单线程事件循环内无需加锁）"""
+    global _next_slot
+    now = time.monotonic()
+    slot = max(now, _next_slot)
+    _next_slot = slot + 1.0 / REQUESTS_PER_SEC
+    await asyncio.sleep(slot - now + random.uniform(0, JITTER))
+
+
+async def fetch_html(session: aiohttp.ClientSession, url: str) -> str:
     for attempt in range(RETRY + 1):
+        await wait_rate_slot()
         try:
-            resp = requests.get(url, headers=headers, timeout=TIMEOUT)
-            if resp.status_code == 200:
-                return resp.text
-            logging.warning(f"HTTP {resp.status_code} for {url}")
-        except requests.RequestException as e:
-            logging.warning(f"请求失败 {e} (尝试 {attempt+1}/{RETRY+1})")
-        time.sleep(0.7 + 0.5 * attempt)
+            async with session.get(url) as resp:
+                if resp.status == 200:
+                    # 与 requests 的 .text 一致：遇到非法字节替换而不是抛 UnicodeDecodeError
+                    return await resp.text(errors="replace")
+                logging.warning(f"HTTP {resp.status} for {url}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.warning(f"请求失败 {e!r} (尝试 {attempt+1}/{RETRY+1})")
+        await asyncio.sleep(0.7 + 0.5 * attempt)
     return ""
 
 
@@ -74,28 +116,21 @@ def parse_definitions(html: str) -> List[str]:
     """
     if not html:
         return []
-    soup = BeautifulSoup(html, "lxml")
+    try:
+        # 以 bytes 传给 lxml 并指定编码：str 带 <?xml encoding=...?> 声明时 lxml 会直接拒绝
+        tree = LH.fromstring(html.encode("utf-8"), parser=_HTML_PARSER)
+    except (ValueError, etree.ParserError) as e:
+        logging.warning(f"解析页面失败 {e!r}")
+        return []
 
     defs = []
-    phrs = soup.select_one("#phrsListTab")
-    if phrs:
-        for li in phrs.select("div.trans-container ul li"):
-            text = " ".join(li.get_text(" ", strip=True).split())
-            if text:
-                defs.append(text)
-
-    if not defs:
-        for blk in soup.select("div.trans-container ul li"):
-            text = " ".join(blk.get_text(" ", strip=True).split())
-            if text:
-                defs.append(text)
-
-    if not defs:
-        collins_items = soup.select("div#collinsResult div.collinsMajorTrans p")
-        for p in collins_items[:3]:
-            text = " ".join(p.get_text(" ", strip=True).split())
+    for xpath, limit in ((XPATH_PHRS, None), (XPATH_TRANS, None), (XPATH_COLLINS, 3)):
+        for el in tree.xpath(xpath)[:limit]:
+            text = " ".join(" ".join(el.xpath(".//text()")).split())
             if text:
                 defs.append(text)
+        if defs:
+            break
 
     # 去重 & 截断
     seen, uniq = set(), []
@@ -106,9 +141,9 @@ def parse_definitions(html: str) -> List[str]:
     return uniq[:5]  # 最多取前 5 条
 
 
-def get_youdao_definition(word: str) -> str:
+async def get_youdao_definition(session: aiohttp.ClientSession, word: str) -> str:
     url = BASE_URL.format(word=word)
-    html = fetch_html(url)
+    html = await fetch_html(session, url)
     defs = parse_definitions(html)
     if not defs:
         return ""
@@ -116,34 +151,130 @@ def get_youdao_definition(word: str) -> str:
     return "\n".join(defs)
 
 
+# ---------- 本地缓存（key = word.casefold()） ----------
+def open_cache(path: pathlib.Path) -> sqlite3.Connection:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path))
+    conn.execute("CREATE TABLE IF NOT EXISTS defs(key TEXT PRIMARY KEY, def TEXT, fetched_at INTEGER)")
+    return conn
+
+
+def cache_get(conn: sqlite3.Connection, key: str) -> Optional[str]:
+    """返回未过期的缓存释义；没有或已过期返回 None"""
+    min_fetched_at = int(time.time()) - CACHE_TTL_DAYS * 86400
+    row = conn.execute("SELECT def FROM defs WHERE key=? AND fetched_at>=?", (key, min_fetched_at)).fetchone()
+    return row[0] if row else None
+
+
+def cache_put(conn: sqlite3.Connection, key: str, definition: str):
+    conn.execute("INSERT OR REPLACE INTO defs(key, def, fetched_at) VALUES (?, ?, ?)",
+                 (key, definition, int(time.time())))
+
+
+async def fetch_all(words: List[str], keys: List[str], todo: List[int], definitions: List[str],
+                    cache: sqlite3.Connection):
+    """并发抓取 words 中下标在 todo 里的单词，结果按原下标写回 definitions，并写入缓存"""
+    sem = asyncio.Semaphore(CONCURRENCY)
+    connector = aiohttp.TCPConnector(limit=CONCURRENCY, ttl_dns_cache=300)
+    timeout = aiohttp.ClientTimeout(total=TIMEOUT)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers=HEADERS) as session:
+
+        async def bounded_fetch(i: int):
+            async with sem:
+                return i, await get_youdao_definition(session, words[i])
+
+        pending = 0
+        for done, coro in enumerate(asyncio.as_completed([bounded_fetch(i) for i in todo]), 1):
+            i, definition = await coro
+            w = words[i]
+            # 如果本词抓到的释义里自己含有竖线，顺手替换为换行，保持干净
+            definition = definition.replace(" | ", "\n").replace("|", "\n")
+            definitions[i] = definition
+            if definition:  # 抓取失败的不缓存，下次重试
+                cache_put(cache, keys[i], definition)
+                pending += 1
+                if pending >= CACHE_COMMIT_EVERY:
+                    cache.commit()
+                    pending = 0
+            preview = definition.replace("\n", " \\n ")
+            logging.info(f"[{done}/{len(todo)}] {w} -> {preview[:100]}{'...' if len(preview)>100 else ''}")
+
+
+# ---------- 输出 ----------
+def write_xlsx(path: pathlib.Path, words: List[str], definitions: List[str]):
+    # write_only 模式逐行写出，不在内存里构建整张表
+    # 保留换行：Excel里同一个单元格会显示为多行（Alt+Enter）
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(["word", "definition"])
+    for w, definition in zip(words, definitions):
+        ws.append([w, definition])
+    wb.save(path)
+
+
+def require_pyarrow():
+    """parquet 输出依赖 pyarrow；在开始抓取前导入，避免抓完才报错。返回 (pyarrow, pyarrow.parquet)"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("输出 parquet 需要先安装 pyarrow：pip install pyarrow") from e
+    return pa, pq
+
+
+def write_parquet(path: pathlib.Path, words: List[str], definitions: List[str], pa, pq):
+    pq.write_table(pa.table({"word": words, "definition": definitions}), path)
+
+
 def main():
+    parser = argparse.ArgumentParser(description="批量抓取有道词典释义并导出")
+    parser.add_argument("--format", choices=["xlsx", "parquet"], default="xlsx",
+                        help="输出格式（默认 xlsx）")
+    parser.add_argument("--refresh", action="store_true",
+                        help=f"忽略本地缓存，全部重新抓取并覆盖缓存（{CACHE_PATH}）")
+    args = parser.parse_args()
+    if args.format == "parquet":
+        pa, pq = require_pyarrow()
+
     # 读取并清理输入路径
     raw = input("请输入 words.txt 文件路径: ").strip().strip('"').strip("'")
     raw = clean_invisibles(raw)
     words_path = pathlib.Path(raw)
     print(f"实际使用路径: {words_path}")
 
-    words = load_words(words_path)
+    words, keys = load_words(words_path)
 
     # 输出文件放在 words.txt 同目录
-    output_xlsx = words_path.parent / "youdao_defs.xlsx"
-
-    rows: List[Tuple[str, str]] = []
-    for i, w in enumerate(words, 1):
-        time.sleep(random.uniform(*SLEEP_RANGE))
-        definition = get_youdao_definition(w)
-        # 如果本词抓到的释义里自己含有竖线，顺手替换为换行，保持干净
-        definition = definition.replace(" | ", "\n").replace("|", "\n")
-        rows.append((w, definition))
-        preview = definition.replace("\n", " \\n ")
-        logging.info(f"[{i}/{len(words)}] {w} -> {preview[:100]}{'...' if len(preview)>100 else ''}")
-
-    df = pd.DataFrame(rows, columns=["word", "definition"])
-    # 保留换行：Excel里同一个单元格会显示为多行（Alt+Enter）
-    with pd.ExcelWriter(output_xlsx, engine="openpyxl") as writer:
-        df.to_excel(writer, index=False)
+    output_path = words_path.parent / f"youdao_defs.{args.format}"
+
+    cache = open_cache(CACHE_PATH)
+    try:
+        # 先查缓存，只抓未命中的单词
+        definitions: List[str] = [""] * len(words)
+        todo: List[int] = []
+        for i, key in enumerate(keys):
+            cached = None if args.refresh else cache_get(cache, key)
+            if cached is None:
+                todo.append(i)
+            else:
+                definitions[i] = cached
+        logging.info(f"缓存命中 {len(words) - len(todo)} 个，需抓取 {len(todo)} 个")
+
+        # asyncio 并发抓取（由 wait_rate_slot 统一限速），结果按 words 原顺序写回
+        if todo:
+            asyncio.run(fetch_all(words, keys, todo, definitions, cache))
+    finally:
+        # 即使抓取中途出错，也先提交已抓到的释义再关闭
+        cache.commit()
+        cache.close()
+
+    if args.format == "parquet":
+        write_parquet(output_path, words, definitions, pa, pq)
+        logging.info(f"已生成 {output_path}（两列：word, definition）")
+        return
 
-    logging.info(f"已生成 {output_xlsx}（两列：word, definition，释义为多行）")
+    write_xlsx(output_path, words, definitions)
+    logging.info(f"已生成 {output_path}（两列：word, definition，释义为多行）")
     print("\n导入 Anki 提示：\n- 使用“文件→导入”，选择该 Excel 转成的 TSV/CSV 或直接用 CSV 导出\n- 导入向导里勾选 ‘保留换行(Keep line breaks)’，即可在卡片上按行显示\n- 字段映射：Front=word, Back=definition\n")
 
 